@@ -1,18 +1,18 @@
 # Autodetecting setup.py script for building the Python extensions
 
-import argparse
+import copy
+import functools
 import importlib._bootstrap
 import importlib.machinery
 import importlib.util
+import itertools
 import logging
 import os
 import re
-import shlex
 import sys
 import sysconfig
+import threading
 import warnings
-from glob import glob, escape
-import _osx_support
 
 
 try:
@@ -51,6 +51,7 @@
     from distutils.command.install import install
     from distutils.command.install_lib import install_lib
     from distutils.core import Extension, setup
+    from distutils.dep_util import newer_group
     from distutils.errors import CCompilerError, DistutilsError
     from distutils.spawn import find_executable
 
@@ -85,6 +86,12 @@ def get_platform():
 AIX = (HOST_PLATFORM.startswith('aix'))
 VXWORKS = ('vxworks' in HOST_PLATFORM)
 
+if MACOS:
+    import _osx_support
+
+    # Darwin major version of the build machine
+    MACOS_OS_RELEASE = int(os.uname()[2].split('.')[0])
+
 
 SUMMARY = """
 Python is an interpreted, interactive, object-oriented programming
@@ -120,6 +127,85 @@ def run_command(cmd):
     return os.waitstatus_to_exitcode(status)
 
 
+# Unique suffixes of the run_command_capture() output files
+CAPTURE_IDS = itertools.count()
+
+def run_command_capture(args, tmpdir, stderr=False):
+    """Run the command 'args' (a list) and return its exit code and output.
+
+    The output is what the command writes to stdout, or to stderr if
+    'stderr' is true; stdin and the other stream are redirected to
+    /dev/null.  The bootstrap Python has no usable subprocess module
+    (nor tempfile): it runs the command through the shell and reads its
+    output back from a file in 'tmpdir', which is removed afterwards.
+    """
+    if SUBPROCESS_BOOTSTRAP:
+        import shlex
+        os.makedirs(tmpdir, exist_ok=True)
+        tmpfile = os.path.join(tmpdir, 'capture%d.tmp' % next(CAPTURE_IDS))
+        if stderr:
+            redirect = '>/dev/null 2>%s'
+        else:
+            redirect = '>%s 2>/dev/null'
+        ret = run_command('%s </dev/null %s'
+                          % (shlex.join(args),
+                             redirect % shlex.quote(tmpfile)))
+        try:
+            with open(tmpfile) as fp:
+                return ret, fp.read()
+        finally:
+            os.unlink(tmpfile)
+
+    import subprocess
+    if stderr:
+        streams = dict(stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    else:
+        streams = dict(stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        proc = subprocess.run(args, stdin=subprocess.DEVNULL, text=True,
+                              **streams)
+    except OSError:
+        # like the shell, when the command cannot be executed
+        return 127, ''
+    return proc.returncode, proc.stderr if stderr else proc.stdout
+
+
+# Job count of "make -jN" in MAKEFLAGS
+MAKEFLAGS_JOBS_RE = re.compile(r'-j\s*(\d+)')
+# Sysroot of the compiler in CC, CFLAGS, LDFLAGS...
+SYSROOT_RE = re.compile(r'--sysroot=([^"]\S*|"[^"]+")')
+# macOS SDK selected in CFLAGS
+ISYSROOT_RE = re.compile(r'-isysroot\s*(\S+)')
+# Architectures selected in CFLAGS
+ARCH_RE = re.compile(r'-arch\s+(\w+)')
+# Search paths of the "libraries: = path1:path2" line of
+# "wr-cc --print-search-dirs"
+WRCC_LIBRARIES_RE = re.compile(r'^libraries[^=\n]*=([^=\n]*)', re.MULTILINE)
+# -I, -L and -l options of the OPENSSL_INCLUDES, OPENSSL_LDFLAGS and
+# OPENSSL_LIBS variables, by option.  The argument may be separated from
+# the option and runs up to the next option, so it may contain spaces.
+OPENSSL_FLAG_RES = {
+    sep: re.compile(r'(?:^|\s)%s\s*(\S.*?)(?=\s+%s|\s*$)' % (sep, sep))
+    for sep in ('-I', '-L', '-l')}
+# curses library named in ldd or readelf output
+CURSES_LIB_RE = re.compile(r'.*lib(n?cursesw?)\.so.*')
+
+# A token of compiler or linker flags is a run of unquoted, "double quoted"
+# and 'single quoted' text.
+FLAG_TOKEN_RE = re.compile(r'''(?:[^\s"']+|"[^"]*"|'[^']*')+''')
+FLAG_QUOTE_RE = re.compile(r'"([^"]*)"' r"|'([^']*)'")
+
+
+def split_flags(flags):
+    """Split compiler or linker flags from the Makefile like shlex.split().
+
+    Quotes are removed, backslash escapes are not supported: the Makefile
+    flags don't use them.  This is much faster than shlex.
+    """
+    return [FLAG_QUOTE_RE.sub(r'\1\2', token)
+            for token in FLAG_TOKEN_RE.findall(flags)]
+
+
 # Set common compiler and linker flags derived from the Makefile,
 # reserved for building the interpreter and the stdlib modules.
 # See bpo-21121 and bpo-35257
@@ -129,6 +215,18 @@ def set_compiler_flags(compiler_flags, compiler_py_flags_nodist):
     sysconfig.get_config_vars()[compiler_flags] = flags + ' ' + py_flags_nodist
 
 
+IS_DIR = {}
+
+def is_dir(path):
+    """Like os.path.isdir(path), but cached: the same search directories
+    are offered to add_dir_to_list() many times.
+    """
+    result = IS_DIR.get(path)
+    if result is None:
+        result = IS_DIR[path] = os.path.isdir(path)
+    return result
+
+
 def add_dir_to_list(dirlist, dir):
     """Add the directory 'dir' to the list 'dirlist' (after any relative
     directories) if:
@@ -136,8 +234,26 @@ def add_dir_to_list(dirlist, dir):
     1) 'dir' is not already in 'dirlist'
     2) 'dir' actually exists, and is a directory.
     """
-    if dir is None or not os.path.isdir(dir) or dir in dirlist:
+    if dir is None or dir in dirlist or not is_dir(dir):
         return
+    insert_dir(dirlist, dir)
+
+
+def add_dirs_to_list(dirlist, dirs):
+    """Like add_dir_to_list() for each directory of 'dirs' in turn, but
+    check whether they are already present against a set built once,
+    rather than scanning 'dirlist' for each of them.
+    """
+    present = set(dirlist)
+    for dir in dirs:
+        if dir is None or dir in present or not is_dir(dir):
+            continue
+        present.add(dir)
+        insert_dir(dirlist, dir)
+
+
+def insert_dir(dirlist, dir):
+    # Insert 'dir' after any relative directories
     for i, path in enumerate(dirlist):
         if not os.path.isabs(path):
             dirlist.insert(i + 1, dir)
@@ -158,7 +274,7 @@ def sysroot_paths(make_vars, subdirs):
     for var_name in make_vars:
         var = sysconfig.get_config_var(var_name)
         if var is not None:
-            m = re.search(r'--sysroot=([^"]\S*|"[^"]+")', var)
+            m = SYSROOT_RE.search(var)
             if m is not None:
                 sysroot = m.group(1).strip('"')
                 for subdir in subdirs:
@@ -193,7 +309,7 @@ def macosx_sdk_root():
         return MACOS_SDK_ROOT
 
     cflags = sysconfig.get_config_var('CFLAGS')
-    m = re.search(r'-isysroot\s*(\S+)', cflags)
+    m = ISYSROOT_RE.search(cflags)
     if m is not None:
         MACOS_SDK_ROOT = m.group(1)
         MACOS_SDK_SPECIFIED = MACOS_SDK_ROOT != '/'
@@ -219,7 +335,7 @@ def macosx_sdk_specified():
     global MACOS_SDK_SPECIFIED
 
     # If already called, return cached result.
-    if MACOS_SDK_SPECIFIED:
+    if MACOS_SDK_SPECIFIED is not None:
         return MACOS_SDK_SPECIFIED
 
     # Find the sdk root and set MACOS_SDK_SPECIFIED
@@ -236,12 +352,99 @@ def is_macosx_sdk_path(path):
                 or path.startswith('/System/iOSSupport') )
 
 
-def grep_headers_for(function, headers):
+# Mach-O CPU types, mapped to the names used by "-arch"
+MACHO_CPU_TYPES = {
+    7: 'i386',
+    0x01000007: 'x86_64',
+    18: 'ppc',
+    0x01000012: 'ppc64',
+    0x0100000c: 'arm64',
+}
+
+def macho_fat_archs(path):
+    """Return the architectures of the universal (fat) Mach-O binary
+    'path', in the order of its header.
+
+    Return an empty list if 'path' is not a universal binary.  This
+    reads the big-endian fat_header and fat_arch structures directly:
+    the struct module is not available yet.
+    """
+    try:
+        with open(path, 'rb') as fp:
+            header = fp.read(8)
+            magic = int.from_bytes(header[:4], 'big')
+            if magic == 0xcafebabe:
+                size = 20   # struct fat_arch
+            elif magic == 0xcafebabf:
+                size = 32   # struct fat_arch_64
+            else:
+                return []
+            nfat_arch = int.from_bytes(header[4:], 'big')
+            data = fp.read(nfat_arch * size)
+    except OSError:
+        return []
+    archs = []
+    for offset in range(0, len(data) - size + 1, size):
+        cputype = int.from_bytes(data[offset:offset + 4], 'big')
+        arch = MACHO_CPU_TYPES.get(cputype)
+        if arch is None:
+            continue
+        cpusubtype = int.from_bytes(data[offset + 4:offset + 8], 'big')
+        if arch == 'arm64' and cpusubtype & 0xffffff == 2:
+            arch = 'arm64e'
+        archs.append(arch)
+    return archs
+
+
+def list_headers(directory):
+    """Return the paths of the header files (*.h) in 'directory'."""
+    try:
+        with os.scandir(directory) as it:
+            return [entry.path for entry in it
+                    if entry.name.endswith('.h')
+                    and entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def grep_headers_for(functions, headers):
+    """Return the set of the names in 'functions' which appear in at
+    least one of 'headers'.  Each header is read once, however many
+    names are searched.
+    """
+    # Search the raw bytes, there is no need to decode the headers.
+    # (mmap cannot be used: the module is built by this script.)
+    needles = {function.encode(): function for function in functions}
+    found = set()
     for header in headers:
-        with open(header, 'r', errors='surrogateescape') as f:
-            if function in f.read():
-                return True
-    return False
+        with open(header, 'rb') as f:
+            content = f.read()
+        for needle, function in needles.items():
+            if needle in content:
+                found.add(function)
+        if len(found) == len(needles):
+            break
+    return found
+
+
+# Cache of directory listings, see file_exists().  setup.py doesn't create
+# files in the directories it searches, so the listings never go stale.
+DIR_ENTRIES = {}
+
+def file_exists(path):
+    """Like os.path.exists(path), but only stat 'path' if its name is
+    listed in its parent directory.  Directory listings are cached, so
+    a miss costs no system call once the directory has been listed.
+    """
+    dirname, name = os.path.split(path)
+    entries = DIR_ENTRIES.get(dirname)
+    if entries is None:
+        try:
+            entries = frozenset(os.listdir(dirname or os.curdir))
+        except OSError:
+            entries = frozenset()
+        DIR_ENTRIES[dirname] = entries
+    return name in entries and os.path.exists(path)
 
 
 def find_file(filename, std_dirs, paths):
@@ -260,81 +463,39 @@ def find_file(filename, std_dirs, paths):
         # An SDK is a directory with the same structure as a real
         # system, but with only header files and libraries.
         sysroot = macosx_sdk_root()
+    else:
+        sysroot = None
 
     # Check the standard locations
     for dir_ in std_dirs:
-        f = os.path.join(dir_, filename)
-
-        if MACOS and is_macosx_sdk_path(dir_):
+        if sysroot is not None and is_macosx_sdk_path(dir_):
             f = os.path.join(sysroot, dir_[1:], filename)
+        else:
+            f = os.path.join(dir_, filename)
 
-        if os.path.exists(f): return []
+        if file_exists(f): return []
 
     # Check the additional directories
     for dir_ in paths:
-        f = os.path.join(dir_, filename)
-
-        if MACOS and is_macosx_sdk_path(dir_):
+        if sysroot is not None and is_macosx_sdk_path(dir_):
             f = os.path.join(sysroot, dir_[1:], filename)
+        else:
+            f = os.path.join(dir_, filename)
 
-        if os.path.exists(f):
+        if file_exists(f):
             return [dir_]
 
     # Not found anywhere
     return None
 
 
-def find_library_file(compiler, libname, std_dirs, paths):
-    result = compiler.find_library_file(std_dirs + paths, libname)
-    if result is None:
-        return None
-
-    if MACOS:
-        sysroot = macosx_sdk_root()
-
-    # Check whether the found file is in one of the standard directories
-    dirname = os.path.dirname(result)
-    for p in std_dirs:
-        # Ensure path doesn't end with path separator
-        p = p.rstrip(os.sep)
-
-        if MACOS and is_macosx_sdk_path(p):
-            # Note that, as of Xcode 7, Apple SDKs may contain textual stub
-            # libraries with .tbd extensions rather than the normal .dylib
-            # shared libraries installed in /.  The Apple compiler tool
-            # chain handles this transparently but it can cause problems
-            # for programs that are being built with an SDK and searching
-            # for specific libraries.  Distutils find_library_file() now
-            # knows to also search for and return .tbd files.  But callers
-            # of find_library_file need to keep in mind that the base filename
-            # of the returned SDK library file might have a different extension
-            # from that of the library file installed on the running system,
-            # for example:
-            #   /Applications/Xcode.app/Contents/Developer/Platforms/
-            #       MacOSX.platform/Developer/SDKs/MacOSX10.11.sdk/
-            #       usr/lib/libedit.tbd
-            # vs
-            #   /usr/lib/libedit.dylib
-            if os.path.join(sysroot, p[1:]) == dirname:
-                return [ ]
-
-        if p == dirname:
-            return [ ]
-
-    # Otherwise, it must have been in one of the additional directories,
-    # so we have to figure out which one.
-    for p in paths:
-        # Ensure path doesn't end with path separator
-        p = p.rstrip(os.sep)
-
-        if MACOS and is_macosx_sdk_path(p):
-            if os.path.join(sysroot, p[1:]) == dirname:
-                return [ p ]
-
-        if p == dirname:
-            return [p]
-    else:
-        assert False, "Internal error: Path not found in std_dirs or paths"
+@functools.lru_cache(maxsize=4)
+def read_config_h(path, mtime):
+    """Parse the config.h file 'path'.  The result is cached by
+    modification time, and must not be modified.
+    """
+    with open(path) as file:
+        return sysconfig.parse_config_h(file)
 
 
 def validate_tzpath():
@@ -361,23 +522,184 @@ def find_module_file(module, dirlist):
     return os.path.abspath(os.path.join(dirs[0], module))
 
 
+# Name of the file in build_temp holding the detect_modules() results
+DETECT_CACHE = 'detect_cache.pickle'
+
+# Environment variables which the detect_*() methods read
+DETECT_CACHE_ENVIRON = ('_TCLTK_INCLUDES', '_TCLTK_LIBS',
+                        'PY_UNSUPPORTED_OPENSSL_BUILD')
+
+
+# (name, sources, libraries) of the modules which are all pretty
+# straightforward, and compile on pretty much any POSIXish platform.
+# detect_simple_extensions() adds _datetime after the first group and
+# the modules with some UNIX dependencies after the second one, so
+# that the extensions keep their usual order.
+SIMPLE_EXTENSIONS = (
+    (
+        # array objects
+        ('array', ('arraymodule.c',), ()),
+        # Context Variables
+        ('_contextvars', ('_contextvarsmodule.c',), ()),
+        # math library functions, e.g. sin()
+        ('math', ('mathmodule.c',), ('m',)),
+        # complex math library functions
+        ('cmath', ('cmathmodule.c',), ('m',)),
+    ),
+    (
+        # zoneinfo module
+        ('_zoneinfo', ('_zoneinfo.c',), ()),
+        # random number generator implemented in C
+        ('_random', ('_randommodule.c',), ()),
+        # bisect
+        ('_bisect', ('_bisectmodule.c',), ()),
+        # heapq
+        ('_heapq', ('_heapqmodule.c',), ()),
+        # C-optimized pickle replacement
+        ('_pickle', ('_pickle.c',), ()),
+        # _json speedups
+        ('_json', ('_json.c',), ()),
+        # profiler (_lsprof is for cProfile.py)
+        ('_lsprof', ('_lsprof.c', 'rotatingtree.c'), ()),
+        # static Unicode character database
+        ('unicodedata', ('unicodedata.c',), ()),
+        # _opcode module
+        ('_opcode', ('_opcode.c',), ()),
+        # asyncio speedups
+        ('_asyncio', ('_asynciomodule.c',), ()),
+        # _queue module
+        ('_queue', ('_queuemodule.c',), ()),
+        # _statistics module
+        ('_statistics', ('_statisticsmodule.c',), ()),
+        # _typing module
+        ('_typing', ('_typingmodule.c',), ()),
+    ),
+    (
+        # select(2); not on ancient System V
+        ('select', ('selectmodule.c',), ()),
+        # Memory-mapped files (also works on Win32).
+        ('mmap', ('mmapmodule.c',), ()),
+        # Lance Ellinghaus's syslog module
+        # syslog daemon interface
+        ('syslog', ('syslogmodule.c',), ()),
+        # Python interface to subinterpreter C-API.
+        ('_xxsubinterpreters', ('_xxsubinterpretersmodule.c',), ()),
+        # Operations on audio samples
+        # According to #993173, this one should actually work fine on
+        # 64-bit platforms.
+        #
+        # audioop needs libm for floor() in multiple functions.
+        ('audioop', ('audioop.c',), ('m',)),
+        # CSV files
+        ('_csv', ('_csv.c',), ()),
+        # POSIX subprocess module helper.
+        ('_posixsubprocess', ('_posixsubprocess.c',), ()),
+    ),
+)
+
+# (name, sources) of the Unix-only modules built on the host platform
+if MS_WINDOWS:
+    UNIX_EXTENSIONS = ()
+elif VXWORKS:
+    UNIX_EXTENSIONS = (
+        # Jeremy Hylton's rlimit interface
+        ('resource', ('resource.c',)),
+    )
+else:
+    UNIX_EXTENSIONS = (
+        # Steen Lumholt's termios module
+        ('termios', ('termios.c',)),
+        # Jeremy Hylton's rlimit interface
+        ('resource', ('resource.c',)),
+    )
+
+# (name, sources) of the builtin hash modules.  By default we always
+# compile these even when OpenSSL is available (issue #14693). It's
+# harmless and the object code is tiny (40-50 KiB per module, only loaded
+# when actually used).  Modules can be disabled via the
+# --with-builtin-hashlib-hashes configure flag.
+HASH_EXTENSIONS = (
+    ('_md5', ('md5module.c',)),
+    ('_sha1', ('sha1module.c',)),
+    ('_sha256', ('sha256module.c',)),
+    ('_sha512', ('sha512module.c',)),
+    ('_sha3', ('_sha3/sha3module.c',)),
+    ('_blake2', ('_blake2/blake2module.c',
+                 '_blake2/blake2b_impl.c',
+                 '_blake2/blake2s_impl.c')),
+)
+
+# (name, sources) of the limited C API examples
+XXLIMITED_EXTENSIONS = (
+    ('xxlimited', ('xxlimited.c',)),
+    ('xxlimited_35', ('xxlimited_35.c',)),
+)
+
+# Tcl/Tk library versions searched by detect_tkinter(), newest first.
+# The versions with dots are used on Unix, and the versions without
+# dots on Windows, for detection by cygwin.
+TCLTK_VERSIONS = ('8.6', '86', '8.5', '85', '8.4', '84', '8.3', '83',
+                  '8.2', '82', '8.1', '81', '8.0', '80')
+
+
 class PyBuildExt(build_ext):
 
     def __init__(self, dist):
         build_ext.__init__(self, dist)
+        # sysconfig's dict of Makefile and pyconfig.h variables
+        self._cfg = sysconfig.get_config_vars()
+        # The Makefile MODULE_{NAME} state and MODULE_{NAME}_CFLAGS,
+        # _LDFLAGS and _DEPS variables, indexed by upper case module name.
+        self.module_state = {}
+        self.module_cflags = {}
+        self.module_ldflags = {}
+        self.module_deps = {}
+        suffixes = (('_CFLAGS', self.module_cflags),
+                    ('_LDFLAGS', self.module_ldflags),
+                    ('_DEPS', self.module_deps))
+        for key, value in self._cfg.items():
+            if not key.startswith('MODULE_'):
+                continue
+            name = key[len('MODULE_'):]
+            for suffix, variables in suffixes:
+                if name.endswith(suffix):
+                    variables[name[:-len(suffix)]] = value
+                    break
+            else:
+                self.module_state[name] = value
         self.srcdir = None
+        # Extension name -> Extension, kept in sync with self.extensions
+        self.ext_map = {}
         self.lib_dirs = None
         self.inc_dirs = None
         self.config_h_vars = None
+        self.shared_headers = ()
         self.failed = []
         self.failed_on_import = []
+        # guards failed and failed_on_import, which the compile and import
+        # check thread pools append to
+        self.failed_lock = threading.Lock()
         self.missing = []
         self.disabled_configure = []
-        if '-j' in os.environ.get('MAKEFLAGS', ''):
-            self.parallel = True
+
+    def finalize_options(self):
+        build_ext.finalize_options(self)
+        # Unless --parallel was given, build extensions in parallel by
+        # default, using the job count of "make -jN" if there is one.
+        # CPYTHON_PARALLEL_BUILD=0 opts out.
+        if (self.parallel is None
+                and os.environ.get('CPYTHON_PARALLEL_BUILD') != '0'):
+            m = MAKEFLAGS_JOBS_RE.search(os.environ.get('MAKEFLAGS', ''))
+            if m is not None:
+                jobs = int(m.group(1))
+            else:
+                jobs = os.cpu_count() or 1
+            if jobs > 1:
+                self.parallel = jobs
 
     def add(self, ext):
         self.extensions.append(ext)
+        self.ext_map[ext.name] = ext
 
     def addext(self, ext, *, update_flags=True):
         """Add extension with Makefile MODULE_{name} support
@@ -385,9 +707,9 @@ def addext(self, ext, *, update_flags=True):
         if update_flags:
             self.update_extension_flags(ext)
 
-        state = sysconfig.get_config_var(f"MODULE_{ext.name.upper()}")
+        state = self.module_state.get(ext.name.upper())
         if state == "yes":
-            self.extensions.append(ext)
+            self.add(ext)
         elif state == "disabled":
             self.disabled_configure.append(ext.name)
         elif state == "missing":
@@ -397,7 +719,7 @@ def addext(self, ext, *, update_flags=True):
             pass
         else:
             # not migrated to MODULE_{name} yet.
-            self.extensions.append(ext)
+            self.add(ext)
 
     def update_extension_flags(self, ext):
         """Update extension flags with module CFLAGS and LDFLAGS
@@ -410,33 +732,35 @@ def update_extension_flags(self, ext):
         """
         upper_name = ext.name.upper()
         # Parse compiler flags (-I, -D, -U, extra args)
-        cflags = sysconfig.get_config_var(f"MODULE_{upper_name}_CFLAGS")
+        cflags = self.module_cflags.get(upper_name)
         if cflags:
-            for token in shlex.split(cflags):
-                switch = token[0:2]
-                value = token[2:]
-                if switch == '-I':
-                    ext.include_dirs.append(value)
-                elif switch == '-D':
-                    key, _, val = value.partition("=")
-                    if not val:
-                        val = None
-                    ext.define_macros.append((key, val))
-                elif switch == '-U':
-                    ext.undef_macros.append(value)
+            def define_macro(value):
+                key, _, val = value.partition("=")
+                ext.define_macros.append((key, val or None))
+
+            handlers = {
+                '-I': ext.include_dirs.append,
+                '-D': define_macro,
+                '-U': ext.undef_macros.append,
+            }
+            for token in split_flags(cflags):
+                handler = handlers.get(token[0:2])
+                if handler is not None:
+                    handler(token[2:])
                 else:
                     ext.extra_compile_args.append(token)
 
         # Parse linker flags (-L, -l, extra objects, extra args)
-        ldflags = sysconfig.get_config_var(f"MODULE_{upper_name}_LDFLAGS")
+        ldflags = self.module_ldflags.get(upper_name)
         if ldflags:
-            for token in shlex.split(ldflags):
-                switch = token[0:2]
-                value = token[2:]
-                if switch == '-L':
-                    ext.library_dirs.append(value)
-                elif switch == '-l':
-                    ext.libraries.append(value)
+            handlers = {
+                '-L': ext.library_dirs.append,
+                '-l': ext.libraries.append,
+            }
+            for token in split_flags(ldflags):
+                handler = handlers.get(token[0:2])
+                if handler is not None:
+                    handler(token[2:])
                 elif (
                     token[0] != '-' and
                     token.endswith(('.a', '.o', '.so', '.sl', '.dylib'))
@@ -447,8 +771,31 @@ def update_extension_flags(self, ext):
 
         return ext
 
+    def find_library(self, libname, dirs=None):
+        """Like self.compiler.find_library_file(dirs, libname), 'dirs'
+        defaulting to self.lib_dirs.
+
+        The candidate file names are looked up in the cached directory
+        listings of file_exists(), so each directory is listed once for
+        all the libraries probed instead of stat-ing every candidate.
+        """
+        if dirs is None:
+            dirs = self.lib_dirs
+        if MACOS or self.compiler.compiler_type != 'unix':
+            # On macOS, system directories are looked up in the SDK
+            return self.compiler.find_library_file(dirs, libname)
+        # Same order of preference as UnixCCompiler.find_library_file()
+        names = [self.compiler.library_filename(libname, lib_type=lib_type)
+                 for lib_type in ('dylib', 'xcode_stub', 'shared', 'static')]
+        for dir_ in dirs:
+            for name in names:
+                path = os.path.join(dir_, name)
+                if file_exists(path):
+                    return path
+        return None
+
     def set_srcdir(self):
-        self.srcdir = sysconfig.get_config_var('srcdir')
+        self.srcdir = self._cfg.get('srcdir')
         if not self.srcdir:
             # Maybe running on Windows but not using CYGWIN?
             raise ValueError("No source directory; cannot proceed.")
@@ -456,14 +803,15 @@ def set_srcdir(self):
 
     def remove_disabled(self):
         # Remove modules that are present on the disabled list
+        disabled = frozenset(DISABLED_MODULE_LIST)
+        ctypes = self.ext_map.get("_ctypes")
         extensions = [ext for ext in self.extensions
-                      if ext.name not in DISABLED_MODULE_LIST]
+                      if ext.name not in disabled and ext is not ctypes]
         # move ctypes to the end, it depends on other modules
-        ext_map = dict((ext.name, i) for i, ext in enumerate(extensions))
-        if "_ctypes" in ext_map:
-            ctypes = extensions.pop(ext_map["_ctypes"])
+        if ctypes is not None and ctypes.name not in disabled:
             extensions.append(ctypes)
         self.extensions = extensions
+        self.ext_map = {ext.name: ext for ext in extensions}
 
     def update_sources_depends(self):
         # Fix up the autodetected modules, prefixing all the source files
@@ -481,17 +829,17 @@ def update_sources_depends(self):
                                      for filename in self.distribution.scripts]
 
         # Python header files
-        include_dir = escape(sysconfig.get_path('include'))
-        headers = [sysconfig.get_config_h_filename()]
-        headers.extend(glob(os.path.join(include_dir, "*.h")))
-        headers.extend(glob(os.path.join(include_dir, "cpython", "*.h")))
-        headers.extend(glob(os.path.join(include_dir, "internal", "*.h")))
+        include_dir = sysconfig.get_path('include')
+        headers = (sysconfig.get_config_h_filename(),
+                   *list_headers(include_dir),
+                   *list_headers(os.path.join(include_dir, "cpython")),
+                   *list_headers(os.path.join(include_dir, "internal")))
 
         for ext in self.extensions:
             ext.sources = [ find_module_file(filename, moddirlist)
                             for filename in ext.sources ]
             # Update dependencies from Makefile
-            makedeps = sysconfig.get_config_var(f"MODULE_{ext.name.upper()}_DEPS")
+            makedeps = self.module_deps.get(ext.name.upper())
             if makedeps:
                 # remove backslashes from line break continuations
                 ext.depends.extend(
@@ -501,30 +849,30 @@ def update_sources_depends(self):
                 find_module_file(filename, moddirlist) for filename in ext.depends
             ]
             # re-compile extensions if a header file has been changed
-            ext.depends.extend(headers)
+            ext.depends += headers
+        self.shared_headers = headers
 
     def handle_configured_extensions(self):
         # The sysconfig variables built by makesetup that list the already
         # built modules and the disabled modules as configured by the Setup
         # files.
-        sysconf_built = set(sysconfig.get_config_var('MODBUILT_NAMES').split())
-        sysconf_shared = set(sysconfig.get_config_var('MODSHARED_NAMES').split())
-        sysconf_dis = set(sysconfig.get_config_var('MODDISABLED_NAMES').split())
+        sysconf_built = set(self._cfg['MODBUILT_NAMES'].split())
+        sysconf_shared = set(self._cfg['MODSHARED_NAMES'].split())
+        sysconf_dis = set(self._cfg['MODDISABLED_NAMES'].split())
 
-        mods_built = []
-        mods_disabled = []
-        for ext in self.extensions:
-            # If a module has already been built or has been disabled in the
-            # Setup files, don't build it here.
-            if ext.name in sysconf_built:
-                mods_built.append(ext)
-            if ext.name in sysconf_dis:
-                mods_disabled.append(ext)
+        # If a module has already been built or has been disabled in the
+        # Setup files, don't build it here.
+        mods_built = [ext for name, ext in self.ext_map.items()
+                      if name in sysconf_built]
+        mods_disabled = [ext for name, ext in self.ext_map.items()
+                         if name in sysconf_dis]
 
         mods_configured = mods_built + mods_disabled
         if mods_configured:
-            self.extensions = [x for x in self.extensions if x not in
-                               mods_configured]
+            configured = sysconf_built | sysconf_dis
+            self.extensions = [x for x in self.extensions
+                               if x.name not in configured]
+            self.ext_map = {ext.name: ext for ext in self.extensions}
             # Remove the shared libraries built by a previous build.
             for ext in mods_configured:
                 # Don't remove shared extensions which have been built
@@ -532,8 +880,10 @@ def handle_configured_extensions(self):
                 if ext.name in sysconf_shared:
                     continue
                 fullpath = self.get_ext_fullpath(ext.name)
-                if os.path.lexists(fullpath):
+                try:
                     os.unlink(fullpath)
+                except FileNotFoundError:
+                    pass
 
         return mods_built, mods_disabled
 
@@ -546,12 +896,13 @@ def set_compiler_executables(self):
         # unfortunately, distutils doesn't let us provide separate C and C++
         # compilers
         if compiler is not None:
-            (ccshared,cflags) = sysconfig.get_config_vars('CCSHARED','CFLAGS')
+            ccshared, cflags = self._cfg['CCSHARED'], self._cfg['CFLAGS']
             args['compiler_so'] = compiler + ' ' + ccshared + ' ' + cflags
         self.compiler.set_executables(**args)
 
     def build_extensions(self):
         self.set_srcdir()
+        self.ext_map = {ext.name: ext for ext in self.extensions}
 
         # Detect which modules should be compiled
         self.detect_modules()
@@ -577,8 +928,10 @@ def build_extensions(self):
             # use the newly built subprocess module
             del sys.modules['subprocess']
 
-        for ext in self.extensions:
-            self.check_extension_import(ext)
+        # PYTHON_SKIP_IMPORT_CHECK=1 skips loading every built extension,
+        # for jobs which only need the build.
+        if os.environ.get('PYTHON_SKIP_IMPORT_CHECK') != '1':
+            self.check_extension_imports()
 
         self.summary(mods_built, mods_disabled)
 
@@ -590,12 +943,11 @@ def summary(self, mods_built, mods_disabled):
 
         def print_three_column(lst):
             lst.sort(key=str.lower)
-            # guarantee zip() doesn't drop anything
-            while len(lst) % 3:
-                lst.append("")
-            for e, f, g in zip(lst[::3], lst[1::3], lst[2::3]):
-                print("%-*s   %-*s   %-*s" % (longest, e, longest, f,
-                                              longest, g))
+            # pad to complete rows
+            lst.extend([""] * (-len(lst) % 3))
+            fmt = "%-{0}s   %-{0}s   %-{0}s".format(longest)
+            for i in range(0, len(lst), 3):
+                print(fmt % (lst[i], lst[i + 1], lst[i + 2]))
 
         if self.missing:
             print()
@@ -652,18 +1004,71 @@ def print_three_column(lst):
             print()
             print("Could not build the ssl module!")
             print("Python requires a OpenSSL 1.1.1 or newer")
-            if sysconfig.get_config_var("OPENSSL_LDFLAGS"):
+            if self._cfg.get("OPENSSL_LDFLAGS"):
                 print("Custom linker flags may require --with-openssl-rpath=auto")
             print()
 
         if os.environ.get("PYTHONSTRICTEXTENSIONBUILD") and (self.failed or self.failed_on_import):
             raise RuntimeError("Failed to build some stdlib modules")
 
+    def get_outdated_extensions(self):
+        if self.force:
+            return list(self.extensions)
+
+        # Every extension depends on the Python headers: stat them once
+        # rather than once per extension.
+        shared_headers = set(self.shared_headers)
+        headers_mtime = max((os.stat(header).st_mtime
+                             for header in shared_headers), default=0)
+
+        outdated = []
+        for ext in self.extensions:
+            ext_path = self.get_ext_fullpath(ext.name)
+            try:
+                ext_mtime = os.stat(ext_path).st_mtime
+            except FileNotFoundError:
+                outdated.append(ext)
+                continue
+            depends = sorted(ext.sources)
+            depends.extend(dep for dep in ext.depends
+                           if dep not in shared_headers)
+            if (headers_mtime > ext_mtime
+                    or newer_group(depends, ext_path, 'newer')):
+                outdated.append(ext)
+            else:
+                self.announce("skipping '%s' extension (up-to-date)" %
+                              ext.name, level=1)
+        return outdated
+
+    def _build_extensions_serial(self):
+        for ext in self.get_outdated_extensions():
+            with self._filter_build_errors(ext):
+                self.build_extension(ext)
+
+    def _build_extensions_parallel(self):
+        # build_ext.build_extension() calls newer_group(), which stat()s
+        # every source and dependency.  From the worker threads these calls
+        # only contend for the GIL, so find the out-of-date extensions
+        # serially and hand just those to the thread pool.
+        from concurrent.futures import ThreadPoolExecutor
+
+        outdated = self.get_outdated_extensions()
+        workers = self.parallel
+        if workers is True:
+            workers = os.cpu_count()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.build_extension, ext)
+                       for ext in outdated]
+            for ext, fut in zip(outdated, futures):
+                with self._filter_build_errors(ext):
+                    fut.result()
+
     def build_extension(self, ext):
 
         if ext.name == '_ctypes':
             if not self.configure_ctypes(ext):
-                self.failed.append(ext.name)
+                with self.failed_lock:
+                    self.failed.append(ext.name)
                 return
 
         try:
@@ -671,9 +1076,29 @@ def build_extension(self, ext):
         except (CCompilerError, DistutilsError) as why:
             self.announce('WARNING: building of extension "%s" failed: %s' %
                           (ext.name, why))
-            self.failed.append(ext.name)
+            with self.failed_lock:
+                self.failed.append(ext.name)
+            return
+
+    def check_extension_imports(self):
+        # Loading an extension runs its module initialization, which is not
+        # free for modules like _ssl or _decimal: check several at once.
+        # The stdlib extensions must already support being imported from
+        # concurrent threads.  PYTHON_PARALLEL_IMPORT_CHECK=0 checks them
+        # one after the other.
+        workers = min(8, os.cpu_count() or 1)
+        if (workers == 1
+                or os.environ.get('PYTHON_PARALLEL_IMPORT_CHECK') == '0'):
+            for ext in self.extensions:
+                self.check_extension_import(ext)
             return
 
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(self.check_extension_import,
+                                  self.extensions):
+                pass
+
     def check_extension_import(self, ext):
         # Don't try to import an extension that has failed to compile
         if ext.name in self.failed:
@@ -727,68 +1152,62 @@ def check_extension_import(self, ext):
         try:
             importlib._bootstrap._load(spec)
         except ImportError as why:
-            self.failed_on_import.append(ext.name)
+            with self.failed_lock:
+                self.failed_on_import.append(ext.name)
             self.announce('*** WARNING: renaming "%s" since importing it'
                           ' failed: %s' % (ext.name, why), level=3)
             assert not self.inplace
             basename, tail = os.path.splitext(ext_filename)
             newname = basename + "_failed" + tail
-            if os.path.exists(newname):
-                os.remove(newname)
-            os.rename(ext_filename, newname)
+            os.replace(ext_filename, newname)
 
         except:
             exc_type, why, tb = sys.exc_info()
             self.announce('*** WARNING: importing extension "%s" '
                           'failed with %s: %s' % (ext.name, exc_type, why),
                           level=3)
-            self.failed.append(ext.name)
+            with self.failed_lock:
+                self.failed.append(ext.name)
 
-    def add_multiarch_paths(self):
+    def get_multiarch_path_component(self):
         # Debian/Ubuntu multiarch support.
         # https://wiki.ubuntu.com/MultiarchSpec
-        cc = sysconfig.get_config_var('CC')
-        tmpfile = os.path.join(self.build_temp, 'multiarch')
-        if not os.path.exists(self.build_temp):
-            os.makedirs(self.build_temp)
-        ret = run_command(
-            '%s -print-multiarch > %s 2> /dev/null' % (cc, tmpfile))
-        multiarch_path_component = ''
-        try:
-            if ret == 0:
-                with open(tmpfile) as fp:
-                    multiarch_path_component = fp.readline().strip()
-        finally:
-            os.unlink(tmpfile)
-
-        if multiarch_path_component != '':
-            add_dir_to_list(self.compiler.library_dirs,
-                            '/usr/lib/' + multiarch_path_component)
-            add_dir_to_list(self.compiler.include_dirs,
-                            '/usr/include/' + multiarch_path_component)
-            return
+        # Only runs the probes: returns None if there is nothing to add.
+        multiarch = self._cfg.get('MULTIARCH')
+        if multiarch and not CROSS_COMPILING:
+            # configure sets MULTIARCH from '$CC --print-multiarch', or to
+            # PLATFORM_TRIPLET when that prints nothing ('darwin' on macOS).
+            # In the latter case this also skips the dpkg-architecture
+            # probe below; the directories built from a triplet which is
+            # not a Debian multiarch one don't exist, and add_dir_to_list()
+            # drops them.
+            return multiarch
+
+        cc = self._cfg.get('CC')
+        ret, out = run_command_capture(
+            split_flags(cc) + ['-print-multiarch'], self.build_temp)
+        if ret == 0:
+            multiarch_path_component = out.partition('\n')[0].strip()
+            if multiarch_path_component != '':
+                return multiarch_path_component
 
         if not find_executable('dpkg-architecture'):
-            return
-        opt = ''
+            return None
+        args = ['dpkg-architecture', '-qDEB_HOST_MULTIARCH']
         if CROSS_COMPILING:
-            opt = '-t' + sysconfig.get_config_var('HOST_GNU_TYPE')
-        tmpfile = os.path.join(self.build_temp, 'multiarch')
-        if not os.path.exists(self.build_temp):
-            os.makedirs(self.build_temp)
-        ret = run_command(
-            'dpkg-architecture %s -qDEB_HOST_MULTIARCH > %s 2> /dev/null' %
-            (opt, tmpfile))
-        try:
-            if ret == 0:
-                with open(tmpfile) as fp:
-                    multiarch_path_component = fp.readline().strip()
-                add_dir_to_list(self.compiler.library_dirs,
-                                '/usr/lib/' + multiarch_path_component)
-                add_dir_to_list(self.compiler.include_dirs,
-                                '/usr/include/' + multiarch_path_component)
-        finally:
-            os.unlink(tmpfile)
+            args.insert(1, '-t' + self._cfg.get('HOST_GNU_TYPE'))
+        ret, out = run_command_capture(args, self.build_temp)
+        if ret == 0:
+            return out.partition('\n')[0].strip()
+        return None
+
+    def add_multiarch_paths(self, multiarch_path_component):
+        if multiarch_path_component is None:
+            return
+        add_dir_to_list(self.compiler.library_dirs,
+                        '/usr/lib/' + multiarch_path_component)
+        add_dir_to_list(self.compiler.include_dirs,
+                        '/usr/include/' + multiarch_path_component)
 
     def add_wrcc_search_dirs(self):
         # add library search path by wr-cc, the compiler wrapper
@@ -800,73 +1219,59 @@ def convert_mixed_path(path):
             left = path[2:].replace("\\", "/")
             return "/" + drive + left
 
-        def add_search_path(line):
+        def add_search_path(paths):
             # On Windows building machine, VxWorks does
             # cross builds under msys2 environment.
             pathsep = (";" if sys.platform == "msys" else ":")
-            for d in line.strip().split("=")[1].split(pathsep):
-                d = d.strip()
-                if sys.platform == "msys":
-                    # On Windows building machine, compiler
-                    # returns mixed style path like:
-                    # C:\folder1\folder2/folder3/folder4
-                    d = convert_mixed_path(d)
-                d = os.path.normpath(d)
-                add_dir_to_list(self.compiler.library_dirs, d)
-
-        cc = sysconfig.get_config_var('CC')
-        tmpfile = os.path.join(self.build_temp, 'wrccpaths')
-        os.makedirs(self.build_temp, exist_ok=True)
-        try:
-            ret = run_command('%s --print-search-dirs >%s' % (cc, tmpfile))
-            if ret:
-                return
-            with open(tmpfile) as fp:
-                # Parse paths in libraries line. The line is like:
-                # On Linux, "libraries: = path1:path2:path3"
-                # On Windows, "libraries: = path1;path2;path3"
-                for line in fp:
-                    if not line.startswith("libraries"):
-                        continue
-                    add_search_path(line)
-        finally:
-            try:
-                os.unlink(tmpfile)
-            except OSError:
-                pass
+            dirs = [d.strip() for d in paths.split(pathsep)]
+            if sys.platform == "msys":
+                # On Windows building machine, compiler
+                # returns mixed style path like:
+                # C:\folder1\folder2/folder3/folder4
+                dirs = [convert_mixed_path(d) for d in dirs]
+            # normalize each spelling once
+            add_dirs_to_list(self.compiler.library_dirs,
+                             map(os.path.normpath, dict.fromkeys(dirs)))
+
+        cc = self._cfg.get('CC')
+        ret, out = run_command_capture(
+            split_flags(cc) + ['--print-search-dirs'], self.build_temp)
+        if ret:
+            return
+        # Parse paths in libraries line. The line is like:
+        # On Linux, "libraries: = path1:path2:path3"
+        # On Windows, "libraries: = path1;path2;path3"
+        for m in WRCC_LIBRARIES_RE.finditer(out):
+            add_search_path(m.group(1))
 
     def add_cross_compiling_paths(self):
-        cc = sysconfig.get_config_var('CC')
-        tmpfile = os.path.join(self.build_temp, 'ccpaths')
-        if not os.path.exists(self.build_temp):
-            os.makedirs(self.build_temp)
-        ret = run_command('%s -E -v - </dev/null 2>%s 1>/dev/null' % (cc, tmpfile))
-        is_gcc = False
-        is_clang = False
+        cc = self._cfg.get('CC')
+        ret, out = run_command_capture(split_flags(cc) + ['-E', '-v', '-'],
+                                       self.build_temp, stderr=True)
+        # set once the output is known to come from gcc or clang
+        is_gnu_like = False
         in_incdirs = False
-        try:
-            if ret == 0:
-                with open(tmpfile) as fp:
-                    for line in fp.readlines():
-                        if line.startswith("gcc version"):
-                            is_gcc = True
-                        elif line.startswith("clang version"):
-                            is_clang = True
-                        elif line.startswith("#include <...>"):
-                            in_incdirs = True
-                        elif line.startswith("End of search list"):
-                            in_incdirs = False
-                        elif (is_gcc or is_clang) and line.startswith("LIBRARY_PATH"):
-                            for d in line.strip().split("=")[1].split(":"):
-                                d = os.path.normpath(d)
-                                if '/gcc/' not in d:
-                                    add_dir_to_list(self.compiler.library_dirs,
-                                                    d)
-                        elif (is_gcc or is_clang) and in_incdirs and '/gcc/' not in line and '/clang/' not in line:
-                            add_dir_to_list(self.compiler.include_dirs,
-                                            line.strip())
-        finally:
-            os.unlink(tmpfile)
+        include_dirs = []
+        if ret == 0:
+            for line in out.splitlines():
+                if in_incdirs:
+                    if line.startswith("End of search list"):
+                        in_incdirs = False
+                    elif (is_gnu_like and '/gcc/' not in line
+                            and '/clang/' not in line):
+                        include_dirs.append(line.strip())
+                elif line.startswith("#include <...>"):
+                    in_incdirs = True
+                elif line.startswith(("gcc version", "clang version")):
+                    is_gnu_like = True
+                elif is_gnu_like and line.startswith("LIBRARY_PATH"):
+                    _, _, dirs = line.strip().partition("=")
+                    # normalize each spelling once
+                    dirs = [d for d in map(os.path.normpath,
+                                           dict.fromkeys(dirs.split(":")))
+                            if '/gcc/' not in d]
+                    add_dirs_to_list(self.compiler.library_dirs, dirs)
+        add_dirs_to_list(self.compiler.include_dirs, include_dirs)
 
         if VXWORKS:
             self.add_wrcc_search_dirs()
@@ -882,26 +1287,19 @@ def add_ldflags_cppflags(self):
                 ('LDFLAGS', '-R', self.compiler.runtime_library_dirs),
                 ('LDFLAGS', '-L', self.compiler.library_dirs),
                 ('CPPFLAGS', '-I', self.compiler.include_dirs)):
-            env_val = sysconfig.get_config_var(env_var)
+            env_val = self._cfg.get(env_var)
             if env_val:
-                parser = argparse.ArgumentParser()
-                parser.add_argument(arg_name, dest="dirs", action="append")
-
-                # To prevent argparse from raising an exception about any
-                # options in env_val that it mistakes for known option, we
-                # strip out all double dashes and any dashes followed by a
-                # character that is not for the option we are dealing with.
-                #
-                # Please note that order of the regex is important!  We must
-                # strip out double-dashes first so that we don't end up with
-                # substituting "--Long" to "-Long" and thus lead to "ong" being
-                # used for a library directory.
-                env_val = re.sub(r'(^|\s+)-(-|(?!%s))' % arg_name[1],
-                                 ' ', env_val)
-                options, _ = parser.parse_known_args(env_val.split())
-                if options.dirs:
-                    for directory in reversed(options.dirs):
-                        add_dir_to_list(dir_list, directory)
+                # Collect the directories of both "-Ldir" and "-L dir"
+                dirs = []
+                tokens = iter(split_flags(env_val))
+                for token in tokens:
+                    if token == arg_name:
+                        directory = next(tokens, None)
+                        if directory is not None:
+                            dirs.append(directory)
+                    elif token.startswith(arg_name):
+                        dirs.append(token[len(arg_name):])
+                add_dirs_to_list(dir_list, reversed(dirs))
 
     def configure_compiler(self):
         # Ensure that /usr/local is always used, but the local build
@@ -912,22 +1310,30 @@ def configure_compiler(self):
             add_dir_to_list(self.compiler.include_dirs, '/usr/local/include')
         # only change this for cross builds for 3.3, issues on Mageia
         if CROSS_COMPILING:
-            self.add_cross_compiling_paths()
-        self.add_multiarch_paths()
+            # The multiarch probe doesn't depend on the cross compiling
+            # paths: run it while the compiler reports its search paths,
+            # and add the directories in the usual order.
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                multiarch = executor.submit(self.get_multiarch_path_component)
+                self.add_cross_compiling_paths()
+                self.add_multiarch_paths(multiarch.result())
+        else:
+            self.add_multiarch_paths(self.get_multiarch_path_component())
         self.add_ldflags_cppflags()
 
     def init_inc_lib_dirs(self):
         if (not CROSS_COMPILING and
                 os.path.normpath(sys.base_prefix) != '/usr' and
-                not sysconfig.get_config_var('PYTHONFRAMEWORK')):
+                not self._cfg.get('PYTHONFRAMEWORK')):
             # OSX note: Don't add LIBDIR and INCLUDEDIR to building a framework
             # (PYTHONFRAMEWORK is set) to avoid # linking problems when
             # building a framework with different architectures than
             # the one that is currently installed (issue #7473)
             add_dir_to_list(self.compiler.library_dirs,
-                            sysconfig.get_config_var("LIBDIR"))
+                            self._cfg.get("LIBDIR"))
             add_dir_to_list(self.compiler.include_dirs,
-                            sysconfig.get_config_var("INCLUDEDIR"))
+                            self._cfg.get("INCLUDEDIR"))
 
         system_lib_dirs = ['/lib64', '/usr/lib64', '/lib', '/usr/lib']
         system_include_dirs = ['/usr/include']
@@ -935,29 +1341,29 @@ def init_inc_lib_dirs(self):
         # if a file is found in one of those directories, it can
         # be assumed that no additional -I,-L directives are needed.
         if not CROSS_COMPILING:
-            self.lib_dirs = self.compiler.library_dirs + system_lib_dirs
-            self.inc_dirs = self.compiler.include_dirs + system_include_dirs
+            lib_dirs = self.compiler.library_dirs + system_lib_dirs
+            inc_dirs = self.compiler.include_dirs + system_include_dirs
         else:
             # Add the sysroot paths. 'sysroot' is a compiler option used to
             # set the logical path of the standard system headers and
             # libraries.
-            self.lib_dirs = (self.compiler.library_dirs +
-                             sysroot_paths(('LDFLAGS', 'CC'), system_lib_dirs))
-            self.inc_dirs = (self.compiler.include_dirs +
-                             sysroot_paths(('CPPFLAGS', 'CFLAGS', 'CC'),
-                                           system_include_dirs))
+            lib_dirs = (self.compiler.library_dirs +
+                        sysroot_paths(('LDFLAGS', 'CC'), system_lib_dirs))
+            inc_dirs = (self.compiler.include_dirs +
+                        sysroot_paths(('CPPFLAGS', 'CFLAGS', 'CC'),
+                                      system_include_dirs))
 
         config_h = sysconfig.get_config_h_filename()
-        with open(config_h) as file:
-            self.config_h_vars = sysconfig.parse_config_h(file)
+        self.config_h_vars = read_config_h(config_h,
+                                           os.stat(config_h).st_mtime_ns)
 
         # OSF/1 and Unixware have some stuff in /usr/ccs/lib (like -ldb)
         if HOST_PLATFORM in ['osf1', 'unixware7', 'openunix8']:
-            self.lib_dirs += ['/usr/ccs/lib']
+            lib_dirs += ['/usr/ccs/lib']
 
         # HP-UX11iv3 keeps files in lib/hpux folders.
         if HOST_PLATFORM == 'hp-ux11':
-            self.lib_dirs += ['/usr/lib/hpux64', '/usr/lib/hpux32']
+            lib_dirs += ['/usr/lib/hpux64', '/usr/lib/hpux32']
 
         if MACOS:
             # This should work on any unixy platform ;-)
@@ -967,72 +1373,40 @@ def init_inc_lib_dirs(self):
             # NOTE: using shlex.split would technically be more correct, but
             # also gives a bootstrap problem. Let's hope nobody uses
             # directories with whitespace in the name to store libraries.
-            cflags, ldflags = sysconfig.get_config_vars(
-                    'CFLAGS', 'LDFLAGS')
-            for item in cflags.split():
+            for item in self._cfg['CFLAGS'].split():
                 if item.startswith('-I'):
-                    self.inc_dirs.append(item[2:])
+                    inc_dirs.append(item[2:])
 
-            for item in ldflags.split():
+            for item in self._cfg['LDFLAGS'].split():
                 if item.startswith('-L'):
-                    self.lib_dirs.append(item[2:])
-
-    def detect_simple_extensions(self):
-        #
-        # The following modules are all pretty straightforward, and compile
-        # on pretty much any POSIXish platform.
-        #
+                    lib_dirs.append(item[2:])
 
-        # array objects
-        self.add(Extension('array', ['arraymodule.c']))
-
-        # Context Variables
-        self.add(Extension('_contextvars', ['_contextvarsmodule.c']))
+        # Tuples: the detectors share them, see detect_concurrently()
+        self.lib_dirs = tuple(lib_dirs)
+        self.inc_dirs = tuple(inc_dirs)
 
-        # math library functions, e.g. sin()
-        self.add(Extension('math',  ['mathmodule.c'],
-                           libraries=['m']))
+    def detect_simple_extensions(self):
+        # The tables hold tuples: each extension gets its own lists, since
+        # update_extension_flags() and update_sources_depends() modify them.
+        def add_simple(table):
+            for name, sources, libraries in table:
+                self.add(Extension(name, list(sources),
+                                   libraries=list(libraries)))
 
-        # complex math library functions
-        self.add(Extension('cmath', ['cmathmodule.c'],
-                           libraries=['m']))
+        first, second, third = SIMPLE_EXTENSIONS
+        add_simple(first)
 
         # time libraries: librt may be needed for clock_gettime()
         time_libs = []
-        lib = sysconfig.get_config_var('TIMEMODULE_LIB')
+        lib = self._cfg.get('TIMEMODULE_LIB')
         if lib:
             time_libs.append(lib)
 
         # libm is needed by delta_new() that uses round() and by accum() that
         # uses modf().
         self.addext(Extension('_datetime', ['_datetimemodule.c']))
-        # zoneinfo module
-        self.add(Extension('_zoneinfo', ['_zoneinfo.c']))
-        # random number generator implemented in C
-        self.add(Extension("_random", ["_randommodule.c"]))
-        # bisect
-        self.add(Extension("_bisect", ["_bisectmodule.c"]))
-        # heapq
-        self.add(Extension("_heapq", ["_heapqmodule.c"]))
-        # C-optimized pickle replacement
-        self.add(Extension("_pickle", ["_pickle.c"]))
-        # _json speedups
-        self.add(Extension("_json", ["_json.c"]))
 
-        # profiler (_lsprof is for cProfile.py)
-        self.add(Extension('_lsprof', ['_lsprof.c', 'rotatingtree.c']))
-        # static Unicode character database
-        self.add(Extension('unicodedata', ['unicodedata.c']))
-        # _opcode module
-        self.add(Extension('_opcode', ['_opcode.c']))
-        # asyncio speedups
-        self.add(Extension("_asyncio", ["_asynciomodule.c"]))
-        # _queue module
-        self.add(Extension("_queue", ["_queuemodule.c"]))
-        # _statistics module
-        self.add(Extension("_statistics", ["_statisticsmodule.c"]))
-        # _typing module
-        self.add(Extension("_typing", ["_typingmodule.c"]))
+        add_simple(second)
 
         # Modules with some UNIX dependencies -- on by default:
         # (If you have a really backward UNIX, select and socket may not be
@@ -1057,41 +1431,7 @@ def detect_simple_extensions(self):
         elif not AIX:
             self.missing.append('spwd')
 
-        # select(2); not on ancient System V
-        self.add(Extension('select', ['selectmodule.c']))
-
-        # Memory-mapped files (also works on Win32).
-        self.add(Extension('mmap', ['mmapmodule.c']))
-
-        # Lance Ellinghaus's syslog module
-        # syslog daemon interface
-        self.add(Extension('syslog', ['syslogmodule.c']))
-
-        # Python interface to subinterpreter C-API.
-        self.add(Extension('_xxsubinterpreters', ['_xxsubinterpretersmodule.c']))
-
-        #
-        # Here ends the simple stuff.  From here on, modules need certain
-        # libraries, are platform-specific, or present other surprises.
-        #
-
-        # Multimedia modules
-        # These don't work for 64-bit platforms!!!
-        # These represent audio samples or images as strings:
-        #
-        # Operations on audio samples
-        # According to #993173, this one should actually work fine on
-        # 64-bit platforms.
-        #
-        # audioop needs libm for floor() in multiple functions.
-        self.add(Extension('audioop', ['audioop.c'],
-                           libraries=['m']))
-
-        # CSV files
-        self.add(Extension('_csv', ['_csv.c']))
-
-        # POSIX subprocess module helper.
-        self.add(Extension('_posixsubprocess', ['_posixsubprocess.c']))
+        add_simple(third)
 
     def detect_test_extensions(self):
         # Python C API test module
@@ -1119,60 +1459,57 @@ def detect_readline_curses(self):
         # readline
         readline_termcap_library = ""
         curses_library = ""
-        # Cannot use os.popen here in py3k.
-        tmpfile = os.path.join(self.build_temp, 'readline_termcap_lib')
-        if not os.path.exists(self.build_temp):
-            os.makedirs(self.build_temp)
         # Determine if readline is already linked against curses or tinfo.
-        if sysconfig.get_config_var('HAVE_LIBREADLINE'):
-            if sysconfig.get_config_var('WITH_EDITLINE'):
+        if self._cfg.get('HAVE_LIBREADLINE'):
+            if self._cfg.get('WITH_EDITLINE'):
                 readline_lib = 'edit'
             else:
                 readline_lib = 'readline'
-            do_readline = self.compiler.find_library_file(self.lib_dirs,
-                readline_lib)
-            if CROSS_COMPILING:
-                ret = run_command("%s -d %s | grep '(NEEDED)' > %s"
-                                % (sysconfig.get_config_var('READELF'),
-                                   do_readline, tmpfile))
+            do_readline = self.find_library(readline_lib)
+            lines = []
+            if not do_readline or LIST_MODULE_NAMES:
+                # only the libraries of the extension depend on the probe
+                pass
+            elif CROSS_COMPILING:
+                ret, out = run_command_capture(
+                    split_flags(self._cfg.get('READELF'))
+                    + ['-d', do_readline], self.build_temp)
+                if ret == 0:
+                    lines = [ln for ln in out.splitlines() if '(NEEDED)' in ln]
             elif find_executable('ldd'):
-                ret = run_command("ldd %s > %s" % (do_readline, tmpfile))
-            else:
-                ret = 1
-            if ret == 0:
-                with open(tmpfile) as fp:
-                    for ln in fp:
-                        if 'curses' in ln:
-                            readline_termcap_library = re.sub(
-                                r'.*lib(n?cursesw?)\.so.*', r'\1', ln
-                            ).rstrip()
-                            break
-                        # termcap interface split out from ncurses
-                        if 'tinfo' in ln:
-                            readline_termcap_library = 'tinfo'
-                            break
-            if os.path.exists(tmpfile):
-                os.unlink(tmpfile)
+                ret, out = run_command_capture(['ldd', do_readline],
+                                               self.build_temp)
+                if ret == 0:
+                    lines = out.splitlines()
+            for ln in lines:
+                if 'curses' in ln:
+                    readline_termcap_library = CURSES_LIB_RE.sub(
+                        r'\1', ln).rstrip()
+                    break
+                # termcap interface split out from ncurses
+                if 'tinfo' in ln:
+                    readline_termcap_library = 'tinfo'
+                    break
         else:
             do_readline = False
         # Issue 7384: If readline is already linked against curses,
         # use the same library for the readline and curses modules.
         if 'curses' in readline_termcap_library:
             curses_library = readline_termcap_library
-        elif self.compiler.find_library_file(self.lib_dirs, 'ncursesw'):
+        elif self.find_library('ncursesw'):
             curses_library = 'ncursesw'
         # Issue 36210: OSS provided ncurses does not link on AIX
         # Use IBM supplied 'curses' for successful build of _curses
-        elif AIX and self.compiler.find_library_file(self.lib_dirs, 'curses'):
+        elif AIX and self.find_library('curses'):
             curses_library = 'curses'
-        elif self.compiler.find_library_file(self.lib_dirs, 'ncurses'):
+        elif self.find_library('ncurses'):
             curses_library = 'ncurses'
-        elif self.compiler.find_library_file(self.lib_dirs, 'curses'):
+        elif self.find_library('curses'):
             curses_library = 'curses'
 
         if MACOS:
-            os_release = int(os.uname()[2].split('.')[0])
-            dep_target = sysconfig.get_config_var('MACOSX_DEPLOYMENT_TARGET')
+            os_release = MACOS_OS_RELEASE
+            dep_target = self._cfg.get('MACOSX_DEPLOYMENT_TARGET')
             if (dep_target and
                     (tuple(int(n) for n in dep_target.split('.')[0:2])
                         < (10, 5) ) ):
@@ -1189,9 +1526,8 @@ def detect_readline_curses(self):
                 pass # Issue 7384: Already linked against curses or tinfo.
             elif curses_library:
                 readline_libs.append(curses_library)
-            elif self.compiler.find_library_file(self.lib_dirs +
-                                                     ['/usr/lib/termcap'],
-                                                     'termcap'):
+            elif self.find_library('termcap',
+                                   (*self.lib_dirs, '/usr/lib/termcap')):
                 readline_libs.append('termcap')
             self.add(Extension('readline', ['readline.c'],
                                library_dirs=['/usr/lib/termcap'],
@@ -1234,9 +1570,9 @@ def detect_readline_curses(self):
         elif curses_library == 'curses' and not MACOS:
                 # OSX has an old Berkeley curses, not good enough for
                 # the _curses module.
-            if (self.compiler.find_library_file(self.lib_dirs, 'terminfo')):
+            if (self.find_library('terminfo')):
                 curses_libs = ['curses', 'terminfo']
-            elif (self.compiler.find_library_file(self.lib_dirs, 'termcap')):
+            elif (self.find_library('termcap')):
                 curses_libs = ['curses', 'termcap']
             else:
                 curses_libs = ['curses']
@@ -1252,7 +1588,7 @@ def detect_readline_curses(self):
         # _curses_panel needs some form of ncurses
         skip_curses_panel = True if AIX else False
         if (curses_enabled and not skip_curses_panel and
-                self.compiler.find_library_file(self.lib_dirs, panel_library)):
+                self.find_library(panel_library)):
             self.add(Extension('_curses_panel', ['_curses_panel.c'],
                            include_dirs=curses_includes,
                            define_macros=curses_defines,
@@ -1269,7 +1605,7 @@ def detect_crypt(self):
             self.missing.append('_crypt')
             return
 
-        if self.compiler.find_library_file(self.lib_dirs, 'crypt'):
+        if self.find_library('crypt'):
             libs = ['crypt']
         else:
             libs = []
@@ -1291,19 +1627,17 @@ def detect_dbm_gdbm(self):
         dbm_order = ['gdbm']
 
         # libdb, gdbm and ndbm headers and libraries
-        have_ndbm_h = sysconfig.get_config_var("HAVE_NDBM_H")
-        have_gdbm_h = sysconfig.get_config_var("HAVE_GDBM_H")
-        have_gdbm_ndbm_h = sysconfig.get_config_var("HAVE_GDBM_NDBM_H")
-        have_gdbm_dash_ndbm_h = sysconfig.get_config_var("HAVE_GDBM_DASH_NDBM_H")
-        have_libndbm = sysconfig.get_config_var("HAVE_LIBNDBM")
-        have_libgdbm = sysconfig.get_config_var("HAVE_LIBGDBM")
-        have_libgdbm_compat = sysconfig.get_config_var("HAVE_LIBGDBM_COMPAT")
-        have_libdb = sysconfig.get_config_var("HAVE_LIBDB")
+        (have_ndbm_h, have_gdbm_h, have_gdbm_ndbm_h, have_gdbm_dash_ndbm_h,
+         have_libndbm, have_libgdbm, have_libgdbm_compat,
+         have_libdb) = (self._cfg.get(name) for name in (
+            "HAVE_NDBM_H", "HAVE_GDBM_H", "HAVE_GDBM_NDBM_H",
+            "HAVE_GDBM_DASH_NDBM_H", "HAVE_LIBNDBM", "HAVE_LIBGDBM",
+            "HAVE_LIBGDBM_COMPAT", "HAVE_LIBDB"))
 
         # The standard Unix dbm module:
         if not CYGWIN:
             config_args = [arg.strip("'")
-                           for arg in sysconfig.get_config_var("CONFIG_ARGS").split()]
+                           for arg in self._cfg.get("CONFIG_ARGS").split()]
             dbm_args = [arg for arg in config_args
                         if arg.startswith('--with-dbmliborder=')]
             if dbm_args:
@@ -1375,13 +1709,9 @@ def detect_sqlite(self):
 
     def detect_platform_specific_exts(self):
         # Unix-only modules
-        if not MS_WINDOWS:
-            if not VXWORKS:
-                # Steen Lumholt's termios module
-                self.add(Extension('termios', ['termios.c']))
-                # Jeremy Hylton's rlimit interface
-            self.add(Extension('resource', ['resource.c']))
-        else:
+        for name, sources in UNIX_EXTENSIONS:
+            self.add(Extension(name, list(sources)))
+        if MS_WINDOWS:
             self.missing.extend(['resource', 'termios'])
 
         # linux/soundcard.h or sys/soundcard.h
@@ -1391,8 +1721,10 @@ def detect_platform_specific_exts(self):
         self.addext(Extension('_scproxy', ['_scproxy.c']))
 
     def detect_compress_exts(self):
+        have_zlib, have_bz2, have_lzma = (self._cfg.get(name) for name in (
+            "HAVE_LIBZ", "HAVE_LIBBZ2", "HAVE_LIBLZMA"))
+
         # Andrew Kuchling's zlib module.
-        have_zlib = sysconfig.get_config_var("HAVE_LIBZ")
         if have_zlib:
             self.add(Extension('zlib', ['zlibmodule.c'],
                                 libraries=['z']))
@@ -1412,14 +1744,14 @@ def detect_compress_exts(self):
                            libraries=libraries))
 
         # Gustavo Niemeyer's bz2 module.
-        if sysconfig.get_config_var("HAVE_LIBBZ2"):
+        if have_bz2:
             self.add(Extension('_bz2', ['_bz2module.c'],
                                libraries=['bz2']))
         else:
             self.missing.append('_bz2')
 
         # LZMA compression support.
-        if sysconfig.get_config_var("HAVE_LIBLZMA"):
+        if have_lzma:
             self.add(Extension('_lzma', ['_lzmamodule.c'],
                                libraries=['lzma']))
         else:
@@ -1458,18 +1790,18 @@ def detect_multiprocessing(self):
                                     '_multiprocessing/semaphore.c']
         else:
             multiprocessing_srcs = ['_multiprocessing/multiprocessing.c']
-            if (sysconfig.get_config_var('HAVE_SEM_OPEN') and not
-                sysconfig.get_config_var('POSIX_SEMAPHORES_NOT_ENABLED')):
+            if (self._cfg.get('HAVE_SEM_OPEN') and not
+                self._cfg.get('POSIX_SEMAPHORES_NOT_ENABLED')):
                 multiprocessing_srcs.append('_multiprocessing/semaphore.c')
         self.add(Extension('_multiprocessing', multiprocessing_srcs,
                            include_dirs=["Modules/_multiprocessing"]))
 
         if (not MS_WINDOWS and
-           sysconfig.get_config_var('HAVE_SHM_OPEN') and
-           sysconfig.get_config_var('HAVE_SHM_UNLINK')):
+           self._cfg.get('HAVE_SHM_OPEN') and
+           self._cfg.get('HAVE_SHM_UNLINK')):
             posixshmem_srcs = ['_multiprocessing/posixshmem.c']
             libs = []
-            if sysconfig.get_config_var('SHM_NEEDS_LIBRT'):
+            if self._cfg.get('SHM_NEEDS_LIBRT'):
                 # need to link with librt to get shm_open()
                 libs.append('rt')
             self.add(Extension('_posixshmem', posixshmem_srcs,
@@ -1481,10 +1813,10 @@ def detect_multiprocessing(self):
 
     def detect_uuid(self):
         # Build the _uuid module if possible
-        uuid_h = sysconfig.get_config_var("HAVE_UUID_H")
-        uuid_uuid_h = sysconfig.get_config_var("HAVE_UUID_UUID_H")
+        uuid_h = self._cfg.get("HAVE_UUID_H")
+        uuid_uuid_h = self._cfg.get("HAVE_UUID_UUID_H")
         if uuid_h or uuid_uuid_h:
-            if sysconfig.get_config_var("HAVE_LIBUUID"):
+            if self._cfg.get("HAVE_LIBUUID"):
                 uuid_libs = ["uuid"]
             else:
                 uuid_libs = []
@@ -1493,41 +1825,199 @@ def detect_uuid(self):
         else:
             self.missing.append('_uuid')
 
+    def detect_concurrently(self, detectors):
+        """Run the functions of 'detectors' concurrently, each passed a
+        copy of self, and return their results for merge_detected().
+
+        The copies have their own extensions, missing and
+        disabled_configure lists, so the result is the same as calling
+        the detectors one after the other.  Everything else they use
+        (compiler, lib_dirs, inc_dirs, config variables) is only read
+        at this stage.  PYTHON_PARALLEL_CONFIGURE=0 runs them serially.
+        """
+        def detect(detector):
+            clone = copy.copy(self)
+            clone.extensions = []
+            clone.ext_map = {}
+            clone.missing = []
+            clone.disabled_configure = []
+            before = dict(vars(clone))
+            detector(clone)
+            # Other attributes set by the detector, like use_system_libffi
+            changed = {name: value for name, value in vars(clone).items()
+                       if before.get(name, before) is not value}
+            return (clone.extensions, clone.missing,
+                    clone.disabled_configure, changed)
+
+        if os.environ.get('PYTHON_PARALLEL_CONFIGURE') == '0':
+            return list(map(detect, detectors))
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(executor.map(detect, detectors))
+
+    def merge_detected(self, results):
+        # Merge the results of detect_concurrently() into self, in order
+        for extensions, missing, disabled_configure, changed in results:
+            for ext in extensions:
+                self.add(ext)
+            self.missing.extend(missing)
+            self.disabled_configure.extend(disabled_configure)
+            for name, value in changed.items():
+                setattr(self, name, value)
+
+    def detect_cache_key(self):
+        """Return what the results of the detect_*() methods depend on.
+
+        That is the configuration (pyconfig.h and the Makefile), this
+        file, the environment variables they read, and the contents of
+        the directories they look into, seen through their mtimes: the
+        library and include directories, the subdirectories and X11,
+        OpenSSL and framework directories probed by some detectors, and
+        the libffi headers, which are read.  On macOS, the system
+        directories are looked up in the SDK, so the SDK root and the SDK
+        copies of those directories count as well.
+        """
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+
+        join = os.path.join
+        dirs = [*self.lib_dirs, *self.inc_dirs]
+        # detect_tkinter() and detect_nis() look into subdirectories
+        for dir_ in self.inc_dirs:
+            dirs.extend(join(dir_, kind + version)
+                        for kind in ('tcl', 'tk')
+                        for version in TCLTK_VERSIONS)
+            dirs += [join(dir_, 'nsl'), join(dir_, 'tirpc')]
+        dirs.extend(join(dir_, 'nsl') for dir_ in self.lib_dirs)
+        # the X11 directories of detect_tkinter()
+        dirs += ['/usr/openwin/include', '/usr/openwin/lib',
+                 '/usr/X11R6/include', '/usr/X11R6/lib64', '/usr/X11R6/lib',
+                 '/usr/X11R5/include', '/usr/X11R5/lib',
+                 '/usr/X11/include', '/usr/X11/lib']
+        for name, sep in (('OPENSSL_INCLUDES', '-I'),
+                          ('OPENSSL_LDFLAGS', '-L')):
+            dirs += OPENSSL_FLAG_RES[sep].findall(self._cfg.get(name) or '')
+        ffi_dirs = [self._cfg.get('LIBFFI_INCLUDEDIR'), '/usr/include/ffi']
+        sysroot = None
+        if MACOS:
+            sysroot = macosx_sdk_root()
+            # detect_tkinter_darwin() looks for Tcl and Tk frameworks
+            dirs += [join('/', 'Library', 'Frameworks'),
+                     join(sysroot, 'Library', 'Frameworks'),
+                     join(sysroot, 'System', 'Library', 'Frameworks')]
+            ffi_dirs.append(join(sysroot, 'usr', 'include', 'ffi'))
+        ffi_dirs += [dir_ for dir_ in self.inc_dirs
+                     if file_exists(join(dir_, 'ffi.h'))]
+        ffi_dirs = [dir_ for dir_ in dict.fromkeys(ffi_dirs) if dir_]
+        dirs += ffi_dirs
+        if MACOS:
+            dirs += [sysroot] + [join(sysroot, dir_[1:]) for dir_ in dirs
+                                 if is_macosx_sdk_path(dir_)]
+        paths = (__file__,
+                 sysconfig.get_config_h_filename(),
+                 sysconfig.get_makefile_filename(),
+                 *dict.fromkeys(dirs),
+                 # detect_ctypes() greps the headers next to ffi.h
+                 *(header for dir_ in ffi_dirs
+                   for header in list_headers(dir_)))
+        return (sys.version, HOST_PLATFORM, sysroot,
+                tuple((path, mtime(path)) for path in paths),
+                tuple(os.environ.get(name) for name in DETECT_CACHE_ENVIRON))
+
+    def load_detect_cache(self, key):
+        """Return the detect_concurrently() results saved by
+        save_detect_cache() with the same key, or None.
+        """
+        try:
+            import pickle
+        except ImportError:
+            # the bootstrap Python has no _struct module yet
+            return None
+        try:
+            with open(os.path.join(self.build_temp, DETECT_CACHE),
+                      'rb') as fp:
+                cached_key, results = pickle.load(fp)
+        except Exception:
+            # missing, unreadable or written by another Python version
+            return None
+        if cached_key != key:
+            return None
+        return results
+
+    def save_detect_cache(self, key, results):
+        try:
+            import pickle
+        except ImportError:
+            return
+        filename = os.path.join(self.build_temp, DETECT_CACHE)
+        os.makedirs(self.build_temp, exist_ok=True)
+        with open(filename + '.tmp', 'wb') as fp:
+            pickle.dump((key, results), fp)
+        os.replace(filename + '.tmp', filename)
+
     def detect_modules(self):
         self.configure_compiler()
         self.init_inc_lib_dirs()
 
+        def detect_tkinter(clone):
+            if not clone.detect_tkinter():
+                clone.missing.append('_tkinter')
+
         # Some C extensions are built by entries in Modules/Setup.bootstrap.
         # These are extensions are required to bootstrap the interpreter or
         # build process.
-        self.detect_simple_extensions()
-        self.detect_test_extensions()
-        self.detect_readline_curses()
-        self.detect_crypt()
-        self.detect_socket()
-        self.detect_openssl_hashlib()
-        self.detect_hash_builtins()
-        self.detect_dbm_gdbm()
-        self.detect_sqlite()
-        self.detect_platform_specific_exts()
-        self.detect_nis()
-        self.detect_compress_exts()
-        self.detect_expat_elementtree()
-        self.detect_multibytecodecs()
-        self.detect_decimal()
-        self.detect_ctypes()
-        self.detect_multiprocessing()
-        if not self.detect_tkinter():
-            self.missing.append('_tkinter')
-        self.detect_uuid()
+        cls = type(self)
+        detectors = (
+            cls.detect_simple_extensions,
+            cls.detect_test_extensions,
+            cls.detect_readline_curses,
+            cls.detect_crypt,
+            cls.detect_socket,
+            cls.detect_openssl_hashlib,
+            cls.detect_hash_builtins,
+            cls.detect_dbm_gdbm,
+            cls.detect_sqlite,
+            cls.detect_platform_specific_exts,
+            cls.detect_nis,
+            cls.detect_compress_exts,
+            cls.detect_expat_elementtree,
+            cls.detect_multibytecodecs,
+            cls.detect_decimal,
+            cls.detect_ctypes,
+            cls.detect_multiprocessing,
+            detect_tkinter,
+            cls.detect_uuid,
+        )
+        if (LIST_MODULE_NAMES
+                or os.environ.get('PYTHON_DETECT_CACHE') == '0'):
+            self.merge_detected(self.detect_concurrently(detectors))
+        else:
+            # Reuse the results of the previous run when nothing they
+            # depend on has changed, as on most incremental rebuilds.
+            # --force always runs the detect_*() methods again, and
+            # PYTHON_DETECT_CACHE=0 disables the cache.
+            key = self.detect_cache_key()
+            results = None if self.force else self.load_detect_cache(key)
+            if results is not None:
+                # The messages the detectors print are not repeated
+                self.announce('INFO: reusing the results of the previous '
+                              'module detection, use --force to redo it', 2)
+            else:
+                results = self.detect_concurrently(detectors)
+                self.save_detect_cache(key, results)
+            self.merge_detected(results)
 
 ##         # Uncomment these lines if you want to play with xxmodule.c
 ##         self.add(Extension('xx', ['xxmodule.c']))
 
         # The limited C API is not compatible with the Py_TRACE_REFS macro.
-        if not sysconfig.get_config_var('Py_TRACE_REFS'):
-            self.add(Extension('xxlimited', ['xxlimited.c']))
-            self.add(Extension('xxlimited_35', ['xxlimited_35.c']))
+        if not self._cfg.get('Py_TRACE_REFS'):
+            for name, sources in XXLIMITED_EXTENSIONS:
+                self.add(Extension(name, list(sources)))
 
     def detect_tkinter_fromenv(self):
         # Build _tkinter using the Tcl/Tk locations specified by
@@ -1670,23 +2160,11 @@ def detect_tkinter_darwin(self):
         compile_args = ['-F', F]
 
         # Do not build tkinter for archs that this Tk was not built with.
-        cflags = sysconfig.get_config_vars('CFLAGS')[0]
-        archs = re.findall(r'-arch\s+(\w+)', cflags)
-
-        tmpfile = os.path.join(self.build_temp, 'tk.arch')
-        if not os.path.exists(self.build_temp):
-            os.makedirs(self.build_temp)
+        cflags = self._cfg['CFLAGS']
+        archs = ARCH_RE.findall(cflags)
 
-        run_command(
-            "file {}/Tk.framework/Tk | grep 'for architecture' > {}".format(F, tmpfile)
-        )
-        with open(tmpfile) as fp:
-            detected_archs = []
-            for ln in fp:
-                a = ln.split()[-1]
-                if a in archs:
-                    detected_archs.append(ln.split()[-1])
-        os.unlink(tmpfile)
+        detected_archs = [a for a in macho_fat_archs(F + '/Tk.framework/Tk')
+                          if a in archs]
 
         arch_args = []
         for a in detected_archs:
@@ -1732,15 +2210,11 @@ def detect_tkinter(self):
             return True
 
         # Assume we haven't found any of the libraries or include files
-        # The versions with dots are used on Unix, and the versions without
-        # dots on Windows, for detection by cygwin.
         tcllib = tklib = tcl_includes = tk_includes = None
-        for version in ['8.6', '86', '8.5', '85', '8.4', '84', '8.3', '83',
-                        '8.2', '82', '8.1', '81', '8.0', '80']:
-            tklib = self.compiler.find_library_file(self.lib_dirs,
-                                                        'tk' + version)
-            tcllib = self.compiler.find_library_file(self.lib_dirs,
-                                                         'tcl' + version)
+        for version in TCLTK_VERSIONS:
+            tklib = self.find_library('tk' + version)
+            # no need to look for Tcl without the matching Tk
+            tcllib = tklib and self.find_library('tcl' + version)
             if tklib and tcllib:
                 # Exit the loop when we've found the Tcl/Tk libraries
                 break
@@ -1754,11 +2228,10 @@ def detect_tkinter(self):
                 # OpenBSD and FreeBSD use Tcl/Tk library names like libtcl83.a,
                 # but the include subdirs are named like .../include/tcl8.3.
                 dotversion = dotversion[:-1] + '.' + dotversion[-1]
-            tcl_include_sub = []
-            tk_include_sub = []
-            for dir in self.inc_dirs:
-                tcl_include_sub += [dir + os.sep + "tcl" + dotversion]
-                tk_include_sub += [dir + os.sep + "tk" + dotversion]
+            tcl_include_sub = [dir + os.sep + "tcl" + dotversion
+                               for dir in self.inc_dirs]
+            tk_include_sub = [dir + os.sep + "tk" + dotversion
+                              for dir in self.inc_dirs]
             tk_include_sub += tcl_include_sub
             tcl_includes = find_file('tcl.h', self.inc_dirs, tcl_include_sub)
             tk_includes = find_file('tk.h', self.inc_dirs, tk_include_sub)
@@ -1801,12 +2274,11 @@ def detect_tkinter(self):
                 return False
 
         # Check for BLT extension
-        if self.compiler.find_library_file(self.lib_dirs + added_lib_dirs,
-                                               'BLT8.0'):
+        blt_dirs = (*self.lib_dirs, *added_lib_dirs)
+        if self.find_library('BLT8.0', blt_dirs):
             defs.append( ('WITH_BLT', 1) )
             libs.append('BLT8.0')
-        elif self.compiler.find_library_file(self.lib_dirs + added_lib_dirs,
-                                                'BLT'):
+        elif self.find_library('BLT', blt_dirs):
             defs.append( ('WITH_BLT', 1) )
             libs.append('BLT')
 
@@ -1839,10 +2311,10 @@ def configure_ctypes(self, ext):
     def detect_ctypes(self):
         # Thomas Heller's _ctypes module
 
-        if (not sysconfig.get_config_var("LIBFFI_INCLUDEDIR") and MACOS):
+        if (not self._cfg.get("LIBFFI_INCLUDEDIR") and MACOS):
             self.use_system_libffi = True
         else:
-            self.use_system_libffi = '--with-system-ffi' in sysconfig.get_config_var("CONFIG_ARGS")
+            self.use_system_libffi = '--with-system-ffi' in self._cfg.get("CONFIG_ARGS")
 
         include_dirs = []
         extra_compile_args = []
@@ -1883,10 +2355,10 @@ def detect_ctypes(self):
         # function my_sqrt() needs libm for sqrt()
         self.addext(Extension('_ctypes_test', ['_ctypes/_ctypes_test.c']))
 
-        ffi_inc = sysconfig.get_config_var("LIBFFI_INCLUDEDIR")
+        ffi_inc = self._cfg.get("LIBFFI_INCLUDEDIR")
         ffi_lib = None
 
-        ffi_inc_dirs = self.inc_dirs.copy()
+        ffi_inc_dirs = self.inc_dirs
         if MACOS:
             ffi_in_sdk = os.path.join(macosx_sdk_root(), "usr/include/ffi")
 
@@ -1898,7 +2370,7 @@ def detect_ctypes(self):
                 else:
                     # OS X 10.5 comes with libffi.dylib; the include files are
                     # in /usr/include/ffi
-                    ffi_inc_dirs.append('/usr/include/ffi')
+                    ffi_inc_dirs += ('/usr/include/ffi',)
 
         if not ffi_inc:
             found = find_file('ffi.h', [], ffi_inc_dirs)
@@ -1911,24 +2383,27 @@ def detect_ctypes(self):
                 print('Header file {} does not exist'.format(ffi_h))
         if ffi_lib is None and ffi_inc:
             for lib_name in ('ffi', 'ffi_pic'):
-                if (self.compiler.find_library_file(self.lib_dirs, lib_name)):
+                if self.find_library(lib_name):
                     ffi_lib = lib_name
                     break
 
         if ffi_inc and ffi_lib:
-            ffi_headers = glob(os.path.join(ffi_inc, '*.h'))
-            if grep_headers_for('ffi_prep_cif_var', ffi_headers):
+            ffi_headers = list_headers(ffi_inc)
+            found = grep_headers_for(('ffi_prep_cif_var',
+                                      'ffi_prep_closure_loc',
+                                      'ffi_closure_alloc'), ffi_headers)
+            if 'ffi_prep_cif_var' in found:
                 ext.extra_compile_args.append("-DHAVE_FFI_PREP_CIF_VAR=1")
-            if grep_headers_for('ffi_prep_closure_loc', ffi_headers):
+            if 'ffi_prep_closure_loc' in found:
                 ext.extra_compile_args.append("-DHAVE_FFI_PREP_CLOSURE_LOC=1")
-            if grep_headers_for('ffi_closure_alloc', ffi_headers):
+            if 'ffi_closure_alloc' in found:
                 ext.extra_compile_args.append("-DHAVE_FFI_CLOSURE_ALLOC=1")
 
             ext.include_dirs.append(ffi_inc)
             ext.libraries.append(ffi_lib)
             self.use_system_libffi = True
 
-        if sysconfig.get_config_var('HAVE_LIBDL'):
+        if self._cfg.get('HAVE_LIBDL'):
             # for dlopen, see bpo-32647
             ext.libraries.append('dl')
 
@@ -1945,23 +2420,19 @@ def detect_decimal(self):
 
     def detect_openssl_hashlib(self):
         # Detect SSL support for the socket module (via _ssl)
-        config_vars = sysconfig.get_config_vars()
-
         def split_var(name, sep):
-            # poor man's shlex, the re module is not available yet.
-            value = config_vars.get(name)
+            # A regex rather than shlex: this works because
+            # ax_check_openssl uses --libs-only-L, --libs-only-l, and
+            # --cflags-only-I, so there is one kind of option per variable.
+            value = self._cfg.get(name)
             if not value:
                 return ()
-            # This trick works because ax_check_openssl uses --libs-only-L,
-            # --libs-only-l, and --cflags-only-I.
-            value = ' ' + value
-            sep = ' ' + sep
-            return [v.strip() for v in value.split(sep) if v.strip()]
+            return OPENSSL_FLAG_RES[sep].findall(value)
 
         openssl_includes = split_var('OPENSSL_INCLUDES', '-I')
         openssl_libdirs = split_var('OPENSSL_LDFLAGS', '-L')
         openssl_libs = split_var('OPENSSL_LIBS', '-l')
-        openssl_rpath = config_vars.get('OPENSSL_RPATH')
+        openssl_rpath = self._cfg.get('OPENSSL_RPATH')
         if not openssl_libs:
             # libssl and libcrypto not found
             self.missing.extend(['_ssl', '_hashlib'])
@@ -2021,23 +2492,8 @@ def split_var(name, sep):
         )
 
     def detect_hash_builtins(self):
-        # By default we always compile these even when OpenSSL is available
-        # (issue #14693). It's harmless and the object code is tiny
-        # (40-50 KiB per module, only loaded when actually used).  Modules can
-        # be disabled via the --with-builtin-hashlib-hashes configure flag.
-
-        self.addext(Extension('_md5', ['md5module.c']))
-        self.addext(Extension('_sha1', ['sha1module.c']))
-        self.addext(Extension('_sha256', ['sha256module.c']))
-        self.addext(Extension('_sha512', ['sha512module.c']))
-        self.addext(Extension('_sha3', ['_sha3/sha3module.c']))
-        self.addext(Extension('_blake2',
-            [
-                '_blake2/blake2module.c',
-                '_blake2/blake2b_impl.c',
-                '_blake2/blake2s_impl.c'
-            ]
-        ))
+        for name, sources in HASH_EXTENSIONS:
+            self.addext(Extension(name, list(sources)))
 
     def detect_nis(self):
         if MS_WINDOWS or CYGWIN or HOST_PLATFORM == 'qnx6':
@@ -2066,17 +2522,17 @@ def detect_nis(self):
         includes_dirs.extend(rpcsvc_inc)
         includes_dirs.extend(rpc_inc)
 
-        if self.compiler.find_library_file(self.lib_dirs, 'nsl'):
+        if self.find_library('nsl'):
             libs.append('nsl')
         else:
             # libnsl-devel: check for libnsl in nsl/ subdirectory
             nsl_dirs = [os.path.join(lib_dir, 'nsl') for lib_dir in self.lib_dirs]
-            libnsl = self.compiler.find_library_file(nsl_dirs, 'nsl')
+            libnsl = self.find_library('nsl', nsl_dirs)
             if libnsl is not None:
                 library_dirs.append(os.path.dirname(libnsl))
                 libs.append('nsl')
 
-        if self.compiler.find_library_file(self.lib_dirs, 'tirpc'):
+        if self.find_library('tirpc'):
             libs.append('tirpc')
 
         self.add(Extension('nis', ['nismodule.c'],
@@ -2118,19 +2574,40 @@ def install(self):
     def set_file_modes(self, files, defaultMode, sharedLibMode):
         if not files: return
 
+        shlib_suffix = self.shlib_suffix
+        count = 0
         for filename in files:
             if os.path.islink(filename): continue
             mode = defaultMode
-            if filename.endswith(self.shlib_suffix): mode = sharedLibMode
-            log.info("changing mode of %s to %o", filename, mode)
+            if filename.endswith(shlib_suffix): mode = sharedLibMode
+            log.debug("changing mode of %s to %o", filename, mode)
             if not self.dry_run: os.chmod(filename, mode)
+            count += 1
+        log.info("changing mode of %d files to %o (shared libraries to %o)",
+                 count, defaultMode, sharedLibMode)
 
     def set_dir_modes(self, dirname, mode):
-        for dirpath, dirnames, fnames in os.walk(dirname):
-            if os.path.islink(dirpath):
+        # Like os.walk(), don't follow symbolic links to directories, but
+        # use the scandir() entries to tell them apart: no extra stat()
+        # per directory.
+        if not os.path.isdir(dirname):
+            return
+        dirs = [] if os.path.islink(dirname) else [dirname]
+        stack = [dirname]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.path)
+                            stack.append(entry.path)
+            except OSError:
                 continue
-            log.info("changing mode of %s to %o", dirpath, mode)
+        for dirpath in dirs:
+            log.debug("changing mode of %s to %o", dirpath, mode)
             if not self.dry_run: os.chmod(dirpath, mode)
+        log.info("changing mode of %d directories in %s to %o",
+                 len(dirs), dirname, mode)
 
 
 class PyBuildScripts(build_scripts):